@@ -76,3 +76,9 @@ sales_df = sales_df[[
 ]]
 
 upload_dataframe_after_date(sales_df, "donut_sales_hourly", "date")
+
+
+# === Refresh Home Page Donut Overview ===
+# v_donut_waste_daily is built from both tables above; rebuild it now instead of waiting for the nightly job
+supabase.rpc("refresh_v_donut_waste_daily").execute()
+print("✅ Refreshed v_donut_waste_daily")
@@ -0,0 +1,28 @@
+"""
+Paginated Supabase reads shared by the dashboard pages
+- Counts the matching rows once, then fetches the 1000-row pages concurrently
+- Orders every page by the table's primary key so concurrent ranges partition the rows
+  (without ORDER BY, Postgres may return pages that overlap or skip rows)
+"""
+
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 1000  # PostgREST's default max rows per response
+
+
+def fetch_rows(query_factory, columns, order_by="id", max_workers=8):
+    """
+    Return every row of a filtered PostgREST query as one DataFrame.
+    query_factory(count=None) must build the filtered select for `columns`; it is called
+    once for the exact count and once per page. An empty result keeps the column names.
+    """
+    total = query_factory(count="exact").limit(1).execute().count or 0
+
+    def fetch_chunk(offset):
+        response = query_factory().order(order_by).range(offset, offset + CHUNK_SIZE - 1).execute()
+        return pd.DataFrame(response.data)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        chunks = list(pool.map(fetch_chunk, range(0, total, CHUNK_SIZE)))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from supabase import create_client
 from datetime import datetime
 
@@ -21,6 +22,13 @@ date_range = st.date_input("Select Date Range", [])
 if st.button("🔄 Refresh Data (Clear Cache)"):
     st.experimental_rerun()
 
+# --- Labor % of Sales (float32, blank where there were no sales) ---
+def labor_pct_of_sales(summary):
+    labor = summary["actual_labor"].to_numpy(dtype=np.float32)
+    sales = summary["sales_value"].to_numpy(dtype=np.float32)
+    pct = np.divide(labor, sales, out=np.full_like(labor, np.nan), where=sales != 0)
+    return np.multiply(pct, 100.0, out=pct)
+
 # --- Load Data (No cache for always-fresh updates) ---
 def load_data(table):
     response = supabase.table(table).select("*").execute()
@@ -70,9 +78,7 @@ daily_summary = merged.groupby("date").agg(
     sales_value=("sales_value", "sum")
 ).reset_index()
 
-daily_summary["actual_labor_pct_sales"] = (
-    daily_summary["actual_labor"] / daily_summary["sales_value"]
-) * 100
+daily_summary["actual_labor_pct_sales"] = labor_pct_of_sales(daily_summary)
 
 # --- Weekly Summary ---
 merged_for_weekly["week"] = pd.to_datetime(merged_for_weekly["date"])
@@ -84,9 +90,7 @@ weekly_summary = merged_for_weekly.groupby(pd.Grouper(key="week", freq="W-SAT"))
     sales_value=("sales_value", "sum")
 ).reset_index()
 weekly_summary["week_start"] = weekly_summary["week"] - pd.to_timedelta(6, unit="d")
-weekly_summary["actual_labor_pct_sales"] = (
-    weekly_summary["actual_labor"] / weekly_summary["sales_value"]
-) * 100
+weekly_summary["actual_labor_pct_sales"] = labor_pct_of_sales(weekly_summary)
 
 # --- Charts ---
 st.subheader("📊 Actual Labor % of Sales")
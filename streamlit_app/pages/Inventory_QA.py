@@ -1,4 +1,7 @@
 import streamlit as st
+import numpy as np
+import time
+from openai import OpenAI
 from sqlalchemy import create_engine
 from urllib.parse import quote_plus
 from langchain.sql_database import SQLDatabase
@@ -35,14 +38,79 @@ except Exception as e:
 # --- Initialize LLM and LangChain SQL Agent ---
 llm = ChatOpenAI(temperature=0, model="gpt-4", openai_api_key=openai_api_key)
 toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-agent_executor = create_sql_agent(llm=llm, toolkit=toolkit, verbose=True)
+agent_executor = create_sql_agent(
+    llm=llm,
+    toolkit=toolkit,
+    verbose=True,
+    agent_executor_kwargs={"return_intermediate_steps": True}
+)
+
+# --- Semantic Answer Cache ---
+# Paraphrased questions re-run an earlier question's SQL instead of the GPT-4 agent.
+SIMILARITY_THRESHOLD = 0.95
+QA_CACHE_TTL = 3600
+QA_CACHE_MAX_ENTRIES = 50
+embedding_client = OpenAI(api_key=openai_api_key)
+
+def get_qa_cache():
+    # Per session, so one user's questions never answer another's and no two script threads
+    # append to the same list: (normalized embedding, sql, answer, stored_at), expired dropped
+    now = time.time()
+    qa_cache = [entry for entry in st.session_state.get("qa_cache", []) if now - entry[3] < QA_CACHE_TTL]
+    st.session_state["qa_cache"] = qa_cache
+    return qa_cache
+
+def embed_question(text):
+    response = embedding_client.embeddings.create(model="text-embedding-3-small", input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def find_cached_answer(qa_cache, embedding):
+    if not qa_cache:
+        return None
+    # One matrix-vector product scores the question against every cached entry
+    scores = np.stack([entry[0] for entry in qa_cache]) @ embedding
+    best = int(np.argmax(scores))
+    return qa_cache[best] if scores[best] > SIMILARITY_THRESHOLD else None
+
+def extract_sql(intermediate_steps):
+    # Last query the agent ran against the database, if any
+    for action, _ in reversed(intermediate_steps):
+        if action.tool == "sql_db_query":
+            tool_input = action.tool_input
+            return tool_input.get("query") if isinstance(tool_input, dict) else tool_input
+    return None
+
+qa_cache = get_qa_cache()
 
 # --- Streamlit chat UI ---
 query = st.text_input("Ask a question about inventory (e.g. top 5 waste items):")
 if query:
     with st.spinner("Thinking..."):
         try:
-            response = agent_executor.run(query)
-            st.success(response)
+            try:
+                embedding = embed_question(query)
+            except Exception:
+                embedding = None
+            cached = find_cached_answer(qa_cache, embedding) if embedding is not None else None
+
+            if cached:
+                _, cached_sql, cached_answer, _ = cached
+                # The stored SQL is re-run so the result reflects the latest data; the earlier
+                # written answer can be out of date (e.g. "last week"), so it is only shown below
+                st.write(db.run(cached_sql))
+                st.caption("♻️ Latest result of the query from a similar earlier question.")
+                with st.expander("Query and earlier answer"):
+                    st.code(cached_sql, language="sql")
+                    st.write(cached_answer)
+            else:
+                result = agent_executor({"input": query})
+                response = result["output"]
+                st.success(response)
+                sql = extract_sql(result["intermediate_steps"])
+                # Only answers backed by a query are reusable, since a hit re-runs that query
+                if embedding is not None and sql:
+                    qa_cache.append((embedding, sql, response, time.time()))
+                    del qa_cache[:-QA_CACHE_MAX_ENTRIES]
         except Exception as e:
             st.error(f"❌ Error: {e}")
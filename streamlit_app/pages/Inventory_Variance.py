@@ -2,7 +2,16 @@ import streamlit as st
 import pandas as pd
 from supabase import create_client
 from datetime import datetime
-import plotly.express as px
+from urllib.parse import quote_plus
+import glob
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+import plotly.graph_objects as go
+from dashboard import supabase_fetch
 
 
 # --- Streamlit Page Config ---
@@ -10,47 +19,165 @@ st.set_page_config(page_title="Inventory Variance", layout="wide")
 st.title("📦 Inventory Variance Analysis")
 
 # --- Supabase Setup ---
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Cached so the client and its HTTP connection pool survive reruns
+@st.cache_resource
+def get_supabase():
+    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+
+supabase = get_supabase()
+
+# --- Optional direct Postgres connection (Arrow) ---
+try:
+    import adbc_driver_postgresql.dbapi as pg_dbapi
+except ImportError:
+    pg_dbapi = None
+
+def get_db_url():
+    if pg_dbapi is None or "SUPABASE_DB_HOST" not in st.secrets:
+        return None
+    encoded_pw = quote_plus(st.secrets["SUPABASE_DB_PASSWORD"])
+    return (
+        f"postgresql://{st.secrets['SUPABASE_DB_USER']}:{encoded_pw}"
+        f"@{st.secrets['SUPABASE_DB_HOST']}:{st.secrets['SUPABASE_DB_PORT']}/{st.secrets['SUPABASE_DB_NAME']}"
+        "?connect_timeout=5"  # an unreachable host falls back to PostgREST quickly
+    )
+
+def build_where(filters):
+    # Bound parameters for the Arrow path; filter values are never inlined into SQL
+    clauses, params = [], []
+    for col, value in filters.items():
+        values = list(value) if isinstance(value, (list, tuple)) else [value]
+        if not values:
+            clauses.append("FALSE")
+            continue
+        placeholders = ", ".join(f"${len(params) + i + 1}" for i in range(len(values)))
+        clauses.append(f'"{col}"::text IN ({placeholders})')
+        params.extend(str(v) for v in values)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+ARROW_POOL_SIZE = 4
+
+@st.cache_resource
+def get_arrow_pool(db_url):
+    # Idle autocommit connections plus a cap on how many are open, shared by the server process;
+    # each query checks one out, so sessions run side by side instead of queueing on one connection
+    return queue.LifoQueue(), threading.BoundedSemaphore(ARROW_POOL_SIZE)
+
+def load_arrow_table(db_url, table, filters, columns):
+    # Postgres -> Arrow -> pandas: typed columns, no per-row Python dicts
+    select_cols = ", ".join(f'"{col}"' for col in columns)
+    where, params = build_where(filters)
+    idle, slots = get_arrow_pool(db_url)
+    with slots:
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = pg_dbapi.connect(db_url, autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'SELECT {select_cols} FROM "{table}"{where}', params or None)
+                df = cur.fetch_arrow_table().to_pandas()
+        except Exception:
+            # Only the connection that failed is dropped; the pooled ones stay usable
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise
+        idle.put(conn)
+        return df
+
+def filtered_query(table, filters, columns, count=None):
+    query = supabase.table(table).select(",".join(columns), count=count)
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple)):
+            query = query.in_(col, list(value))
+        else:
+            query = query.eq(col, value)
+    return query
 
 # --- Load Data from Supabase ---
-@st.cache_data(ttl=3600)
-def load_all_rows(table):
-    all_data = []
-    chunk_size = 1000
-    offset = 0
-    while True:
-        response = supabase.table(table).select("*").range(offset, offset + chunk_size - 1).execute()
-        data_chunk = response.data
-        if not data_chunk:
-            break
-        all_data.extend(data_chunk)
-        offset += chunk_size
-    return pd.DataFrame(all_data)
-
-df = load_all_rows("variance_report_summary")
+# Filters and column projection run in Postgres so only the rows the page shows come back.
+def fetch_rows(table, filters, columns):
+    db_url = get_db_url()
+    if db_url:
+        try:
+            return load_arrow_table(db_url, table, filters, columns)
+        except Exception:
+            pass  # Direct connection unavailable (blocked port, unreachable host, bad credentials): use PostgREST
 
-# --- Check if data is valid ---
-if df.empty:
-    st.warning("No data returned from Supabase. Please ensure the table has records.")
-    st.stop()
+    return supabase_fetch.fetch_rows(
+        lambda count=None: filtered_query(table, filters, columns, count), columns
+    )
 
+# --- Parquet disk cache (second tier; survives worker restarts that clear st.cache_data) ---
+# The two tiers stack (a memory hit can hold a frame read from an aging file), so each gets
+# half of the one-hour freshness budget.
+PARQUET_MAX_AGE = 1800
+PARQUET_MAX_FILES = 50  # one file per filter combination; older ones beyond this are removed
+
+def parquet_cache_path(table, filters, columns):
+    key = hashlib.md5(repr((table, sorted(filters.items()), list(columns))).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"{table}_{key}.parquet")
+
+def prune_parquet_cache(table):
+    # Drop expired files and keep at most PARQUET_MAX_FILES of the newest
+    entries = []
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{table}_{'?' * 12}.parquet")):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            pass  # removed by another session in the meantime
+    entries.sort(reverse=True)
+    now = time.time()
+    for i, (mtime, path) in enumerate(entries):
+        if i >= PARQUET_MAX_FILES or now - mtime >= PARQUET_MAX_AGE:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+@st.cache_data(ttl=1800)
+def load_all_rows(table, filters, columns):
+    path = parquet_cache_path(table, filters, columns)
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < PARQUET_MAX_AGE:
+        return pd.read_parquet(path)
+
+    df = fetch_rows(table, filters, columns)
+    try:
+        # Write then rename so a concurrent reader never sees a half-written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, compression="zstd", index=False)
+        os.replace(tmp_path, path)
+        prune_parquet_cache(table)
+    except Exception:
+        pass  # The disk cache is best-effort; the fetched frame is still returned
+    return df
+
+TABLE = "variance_report_summary"
 required_cols = [
     "pc_number", "reporting_period", "subcategory", "product_name", "qty_variance",
-    "variance", "cogs", "theoretical_value", "theoretical_qty", "units_sold"
+    "variance", "cogs"
 ]
-missing_cols = [col for col in required_cols if col not in df.columns]
-if missing_cols:
-    st.error(f"The following required columns are missing: {missing_cols}")
+
+# --- Filter Options (three narrow columns only) ---
+options_df = load_all_rows(TABLE, {}, ["subcategory", "pc_number", "reporting_period"])
+
+# --- Check if data is valid ---
+if options_df.empty:
+    st.warning("No data returned from Supabase. Please ensure the table has records.")
     st.stop()
 
-# --- Data Type Cleanup ---
-df["pc_number"] = df["pc_number"].astype(str)
-df["reporting_period"] = df["reporting_period"].astype(str)
+# Low-cardinality text columns as Arrow-backed categoricals: integer codes instead of Python strings
+for col in ["subcategory", "pc_number", "reporting_period"]:
+    options_df[col] = options_df[col].astype("string[pyarrow]").astype("category")
+
+def category_options(series):
+    # Categories are stored sorted, so the ones still in use are the option list; no string sort
+    return series.cat.remove_unused_categories().cat.categories.tolist()
 
 # --- Subcategory Filter ---
-all_subcategories = sorted(df["subcategory"].dropna().unique())
+all_subcategories = category_options(options_df["subcategory"])
 default_subcategories = [
     "Bakery", "Beverages", "Coffee", "Condiments Non Deplete", "Cooler Beverages",
     "Cream Cheese", "Dairy", "Muffins", "Sandwiches & Wraps"
@@ -61,11 +188,15 @@ selected_subcategories = st.multiselect(
     default=[s for s in default_subcategories if s in all_subcategories]
 )
 
-df = df[df["subcategory"].isin(selected_subcategories)]
+if not selected_subcategories:
+    st.info("Pick at least one subcategory.")
+    st.stop()
+
+options_df = options_df[options_df["subcategory"].isin(selected_subcategories)]
 
 # --- Store & Period Filters ---
-store_options = ["All"] + sorted(df["pc_number"].unique())
-period_options = ["All"] + sorted(df["reporting_period"].unique(), reverse=True)
+store_options = ["All"] + category_options(options_df["pc_number"])
+period_options = ["All"] + category_options(options_df["reporting_period"])[::-1]
 
 col1, col2 = st.columns(2)
 with col1:
@@ -73,15 +204,36 @@ with col1:
 with col2:
     reporting_period = st.selectbox("Select Reporting Period (Week)", period_options)
 
+# Sorted so the same selection in any click order shares one cache entry and one file
+filters = {"subcategory": tuple(sorted(selected_subcategories))}
 if location_filter != "All":
-    df = df[df["pc_number"] == location_filter]
-
+    filters["pc_number"] = location_filter
+    options_df = options_df[options_df["pc_number"] == location_filter]
 if reporting_period != "All":
-    df = df[df["reporting_period"] == reporting_period]
+    filters["reporting_period"] = reporting_period
+    options_df = options_df[options_df["reporting_period"] == reporting_period]
+
+# The option index already knows when a store/period combination has no rows
+if options_df.empty:
+    st.info("No data available for selected filters.")
+    st.stop()
+
+df = load_all_rows(TABLE, filters, required_cols)
+
+if df.empty:
+    st.info("No data available for selected filters.")
+    st.stop()
+
+missing_cols = [col for col in required_cols if col not in df.columns]
+if missing_cols:
+    st.error(f"The following required columns are missing: {missing_cols}")
+    st.stop()
 
-# --- Calculated Fields ---
-df["Theoretical Cost Variance"] = df["theoretical_value"] - df["cogs"]
-df["Unit Gap"] = df["theoretical_qty"] - df["units_sold"]
+# --- Data Type Cleanup ---
+for col in ["subcategory", "pc_number", "reporting_period"]:
+    df[col] = df[col].astype("string[pyarrow]").astype("category")
+for col in ["qty_variance", "variance", "cogs"]:
+    df[col] = pd.to_numeric(df[col], errors="coerce")
 
 # --- Summary Table ---
 summary = df[[
@@ -96,44 +248,40 @@ st.subheader("📋 Inventory Variance Summary")
 st.dataframe(summary, use_container_width=True)
 
 # --- Charts ---
+def top_abs_rows(frame, col, k=10):
+    # Partial top-k selection on |col|; only the k winners get sorted for display
+    idx = frame[col].abs().nlargest(k).index
+    return frame.loc[idx].sort_values(col)
+
+def top10_bar(top, col, label, title, colorscale):
+    # go.Bar on plain arrays skips plotly express's DataFrame introspection
+    values = top[col].to_numpy()
+    fig = go.Figure(go.Bar(
+        x=values,
+        y=top["product_name"].to_numpy(),
+        orientation="h",
+        marker=dict(color=values, colorscale=colorscale, colorbar=dict(title=label))
+    ))
+    fig.update_layout(title=title, xaxis_title=label, yaxis_title="Product Name", barmode="relative")
+    return fig
+
+top_qty_variance = top_abs_rows(df, "qty_variance")
+top_value_variance = top_abs_rows(df, "variance")
+
 # Chart 1: Top 10 Variance Qty
 st.subheader("🔟 Top 10 Variance by Quantity")
-top_qty_variance = df.reindex(df["qty_variance"].abs().sort_values(ascending=False).index).head(10)
-top_qty_variance = top_qty_variance.sort_values("qty_variance", ascending=True)
 
 if not top_qty_variance.empty:
-    fig1 = px.bar(
-        top_qty_variance,
-        x="qty_variance",
-        y="product_name",
-        orientation="h",
-        labels={"qty_variance": "Variance Qty", "product_name": "Product Name"},
-        title="Top 10 Variance by Quantity",
-        color="qty_variance",
-        color_continuous_scale="Purples",
-        hover_data=["reporting_period", "qty_variance", "variance"]
-    )
+    fig1 = top10_bar(top_qty_variance, "qty_variance", "Variance Qty", "Top 10 Variance by Quantity", "Purples")
     st.plotly_chart(fig1, use_container_width=True)
 else:
     st.info("No data available for selected filters.")
 
 # Chart 2: Top 10 Variance $
 st.subheader("🔟 Top 10 Variance by $")
-top_value_variance = df.reindex(df["variance"].abs().sort_values(ascending=False).index).head(10)
-top_value_variance = top_value_variance.sort_values("variance", ascending=True)
 
 if not top_value_variance.empty:
-    fig2 = px.bar(
-        top_value_variance,
-        x="variance",
-        y="product_name",
-        orientation="h",
-        labels={"variance": "Variance $", "product_name": "Product Name"},
-        title="Top 10 Variance by $",
-        color="variance",
-        color_continuous_scale="Oranges",
-        hover_data=["reporting_period", "variance"]
-    )
+    fig2 = top10_bar(top_value_variance, "variance", "Variance $", "Top 10 Variance by $", "Oranges")
     st.plotly_chart(fig2, use_container_width=True)
 else:
     st.info("No data available for selected filters.")
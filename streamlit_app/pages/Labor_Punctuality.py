@@ -1,127 +1,204 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+import numpy as np
 from supabase import create_client
 import plotly.express as px
+from concurrent.futures import ThreadPoolExecutor
+from dashboard import supabase_fetch
 
 # --- Supabase Setup ---
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Cached so the client and its HTTP connection pool survive reruns
+@st.cache_resource
+def get_supabase():
+    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+
+supabase = get_supabase()
 
 st.set_page_config(page_title="Labor Punctuality", layout="wide")
 st.title("⏱️ Labor Punctuality Report")
 
 # --- Load Data with Pagination ---
-@st.cache_data(ttl=3600)
-def load_all_rows(table):
-    all_data = []
-    chunk_size = 1000
-    offset = 0
-    while True:
-        response = supabase.table(table).select("*").range(offset, offset + chunk_size - 1).execute()
-        data_chunk = response.data
-        if not data_chunk:
-            break
-        all_data.extend(data_chunk)
-        offset += chunk_size
-    df = pd.DataFrame(all_data)
+# Date and store filters and column projection run in Postgres, so only the selected window
+# and the columns the page reads are downloaded.
+CLOCKIN_COLUMNS = ["employee_id", "date", "time_in", "time_out", "employee_name", "pc_number"]
+SCHEDULE_COLUMNS = ["employee_id", "date", "start_time", "end_time"]
+STORE_COLUMNS = ["pc_number", "store_name"]
+
+def filtered_query(table, columns, start=None, end=None, pc_number=None, count=None):
+    query = supabase.table(table).select(",".join(columns), count=count)
+    if start is not None:
+        query = query.gte("date", start)
+    if end is not None:
+        query = query.lte("date", end)
+    if pc_number is not None:
+        query = query.eq("pc_number", pc_number)
+    return query
+
+def fetch_rows(table, columns, start=None, end=None, pc_number=None, order_by="id"):
+    df = supabase_fetch.fetch_rows(
+        lambda count=None: filtered_query(table, columns, start, end, pc_number, count),
+        columns, order_by=order_by
+    )
     df.columns = [str(col).strip().lower() for col in df.columns]
     return df
 
+def fetch_date_bounds(table):
+    # Earliest and latest non-null date via ORDER BY ... LIMIT 1 instead of a full download
+    def edge(desc):
+        response = (
+            supabase.table(table).select("date").not_.is_("date", "null")
+            .order("date", desc=desc).limit(1).execute()
+        )
+        return pd.to_datetime(response.data[0]["date"]) if response.data else None
+    return edge(False), edge(True)
+
+# The fetches below are independent network round-trips, so they run concurrently.
+@st.cache_data(ttl=3600)
+def load_date_bounds():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        clock_bounds = pool.submit(fetch_date_bounds, "employee_clockin")
+        sched_bounds = pool.submit(fetch_date_bounds, "employee_schedules")
+        return clock_bounds.result(), sched_bounds.result()
+
+@st.cache_data(ttl=3600)
+def load_punch_data(start, end, pc_number):
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        clock = pool.submit(fetch_rows, "employee_clockin", CLOCKIN_COLUMNS, start, end, pc_number)
+        sched = pool.submit(fetch_rows, "employee_schedules", SCHEDULE_COLUMNS, start, end)
+        clock_df, sched_df = clock.result(), sched.result()
+    if clock_df.empty or sched_df.empty:
+        return clock_df, sched_df
+
+    # Normalized once behind the cache instead of on every rerun
+    for df in (clock_df, sched_df):
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        df["employee_id"] = df["employee_id"].astype(str).astype("category")
+    # Arrow-backed strings: zfill runs in the Arrow C kernel instead of per Python object
+    clock_df["pc_number"] = clock_df["pc_number"].astype("string[pyarrow]").str.zfill(6).astype("category")
+    # Lower-cased up front so name searches don't redo it on every keystroke
+    clock_df["_name_lower"] = clock_df["employee_name"].str.lower()
+    clock_df["employee_name"] = clock_df["employee_name"].astype("category")
+    return clock_df, sched_df
+
+# The store list is tiny and rarely changes, so it gets a day-long cache of its own
+# and no per-rerun argument hashing of the stores frame.
+@st.cache_data(ttl=86400)
+def get_store_map():
+    # pc_number -> store_name as a Series, so .map() is an index lookup instead of dict probing
+    stores_df = fetch_rows("stores", STORE_COLUMNS, order_by="pc_number")
+    pc_numbers = stores_df["pc_number"].astype("string[pyarrow]").str.zfill(6)
+    store_map = pd.Series(stores_df["store_name"].to_numpy(), index=pc_numbers)
+    # Index kept sorted so the store selectbox can list it as-is
+    return store_map[~store_map.index.duplicated(keep="last")].sort_index()
+
 # --- Load Tables ---
-clock_df = load_all_rows("employee_clockin")
-sched_df = load_all_rows("employee_schedules")
-stores_df = load_all_rows("stores")  # includes pc_number and store_name
+store_map = get_store_map()
+(clock_min, clock_max), (sched_min, sched_max) = load_date_bounds()
 
-if clock_df.empty or sched_df.empty:
+if clock_max is None or sched_max is None:
     st.warning("⚠️ One or both tables are empty.")
     st.stop()
 
-# --- Preprocessing ---
-clock_df["date"] = pd.to_datetime(clock_df["date"], errors="coerce")
-sched_df["date"] = pd.to_datetime(sched_df["date"], errors="coerce")
-clock_df["employee_id"] = clock_df["employee_id"].astype(str)
-sched_df["employee_id"] = sched_df["employee_id"].astype(str)
-clock_df["pc_number"] = clock_df["pc_number"].astype(str).str.zfill(6)
-
 # --- Filters ---
-location_filter = st.selectbox("Select Store", ["All"] + sorted(clock_df["pc_number"].unique()))
+location_filter = st.selectbox("Select Store", ["All"] + store_map.index.dropna().tolist())
 
 # Set default date range based on latest date in clockin table (7 days back from latest)
-latest_clockin_date = clock_df["date"].max()
+latest_clockin_date = clock_max
 default_start_date = latest_clockin_date - pd.Timedelta(days=6)  # 7 days total (including latest date)
 default_end_date = latest_clockin_date
 
 # Overall min/max dates for the date picker limits
-min_date = min(clock_df["date"].min(), sched_df["date"].min())
-max_date = max(clock_df["date"].max(), sched_df["date"].max())
+min_date = min(clock_min, sched_min)
+max_date = max(clock_max, sched_max)
 
 date_range = st.date_input("Select Date Range", [default_start_date, default_end_date], min_value=min_date, max_value=max_date)
 
 st.markdown("### ⚙️ Settings")
 late_threshold = st.slider("Late time threshold (minutes)", min_value=1, max_value=15, value=5)
 
-# --- Apply Filters ---
-if location_filter != "All":
-    clock_df = clock_df[clock_df["pc_number"] == location_filter]
-
+# --- Load Filtered Tables ---
+start = end = None
 if date_range and len(date_range) == 2:
-    start, end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-    clock_df = clock_df[(clock_df["date"] >= start) & (clock_df["date"] <= end)]
-    sched_df = sched_df[(sched_df["date"] >= start) & (sched_df["date"] <= end)]
+    start, end = date_range[0].isoformat(), date_range[1].isoformat()
+store_filter = None if location_filter == "All" else location_filter
+
+clock_df, sched_df = load_punch_data(start, end, store_filter)
+
+if clock_df.empty or sched_df.empty:
+    st.warning("⚠️ No clock-in or schedule data for the selected filters.")
+    st.stop()
 
 # --- Keep earliest clock-in per employee/date ---
-clock_df = clock_df.sort_values(by=["employee_id", "date", "time_in"]).drop_duplicates(subset=["employee_id", "date"], keep="first")
+def earliest_per_day(df, time_col, sort=True):
+    # Per-(employee, date) minimum via a groupby aggregate instead of a three-key sort of every row.
+    # Missing times rank last; sort=True returns rows ordered by (employee_id, date) as before.
+    sort_key = df[time_col].fillna("99:99:99")
+    idx = sort_key.groupby([df["employee_id"], df["date"]], observed=True, sort=sort).idxmin()
+    return df.loc[idx]
+
+clock_df = earliest_per_day(clock_df, "time_in")
 
 # --- Merge Schedule + Clockin ---
-merged_df = pd.merge(
-    sched_df,
-    clock_df[["employee_id", "date", "time_in", "employee_name", "pc_number"]],
-    on=["employee_id", "date"],
-    how="left"
+# Both sides keyed and sorted on (employee_id, date) so the join can walk them in order;
+# clock_df is already in key order from earliest_per_day. Only the columns the evaluation
+# reads are carried, and validate guards against duplicate clock-ins slipping through.
+keys = ["employee_id", "date"]
+sched_keyed = sched_df.set_index(keys)[["start_time"]].sort_index()
+clock_keyed = clock_df.set_index(keys)[["time_in", "employee_name", "pc_number"]]
+merged_df = sched_keyed.join(clock_keyed, how="left", validate="many_to_one").reset_index()
+
+# --- Evaluate Punctuality (vectorized over the whole frame) ---
+STATUS_CATEGORIES = ["On Time", "Late", "Early", "Absent", "On Call", "No Schedule", "Invalid", "Other"]
+
+def minutes_since_midnight(times):
+    # "HH:MM:SS" parsed straight to timedelta64 and divided down to float minutes; no calendar
+    # date involved. Missing/unparseable values and anything past 24h come back as NaN.
+    minutes = (pd.to_timedelta(times, errors="coerce") / pd.Timedelta(minutes=1)).to_numpy(dtype=float)
+    return np.where(minutes < 24 * 60, minutes, np.nan)
+
+start_min = minutes_since_midnight(merged_df["start_time"])
+time_in_min = minutes_since_midnight(merged_df["time_in"])
+delta_min = time_in_min - start_min
+
+no_schedule = merged_df["start_time"].isna().to_numpy()
+no_clockin = merged_df["time_in"].isna().to_numpy()
+unparsed = (np.isnan(start_min) & ~no_schedule) | (np.isnan(time_in_min) & ~no_clockin)
+# delta_min is NaN whenever either time is missing, so these masks are already False there
+on_time = np.abs(delta_min) <= late_threshold
+late = delta_min > late_threshold
+early = delta_min < -late_threshold
+
+status = np.select(
+    [no_schedule & ~no_clockin, no_schedule, no_clockin, unparsed, on_time, late, early],
+    ["On Call", "No Schedule", "Absent", "Invalid", "On Time", "Late", "Early"],
+    default="Other"
 )
-
-# --- Evaluate Punctuality ---
-def evaluate(row):
-    try:
-        if pd.isna(row["start_time"]):
-            if pd.notna(row["time_in"]):
-                return pd.Series(["On Call", None])
-            else:
-                return pd.Series(["No Schedule", None])
-        if pd.isna(row["time_in"]):
-            return pd.Series(["Absent", None])
-
-        start_dt = datetime.combine(datetime.today(), pd.to_datetime(row["start_time"]).time())
-        timein_dt = datetime.combine(datetime.today(), pd.to_datetime(row["time_in"]).time())
-        delta = (timein_dt - start_dt).total_seconds() / 60
-
-        if abs(delta) <= late_threshold:
-            return pd.Series(["On Time", 0])
-        elif delta > late_threshold:
-            return pd.Series(["Late", round(delta)])
-        elif delta < -late_threshold:
-            return pd.Series(["Early", 0])
-        else:
-            return pd.Series(["Other", None])
-    except Exception as e:
-        return pd.Series(["Invalid", None])
-
-
-merged_df[["status", "late_minutes"]] = merged_df.apply(evaluate, axis=1)
+merged_df["status"] = pd.Categorical(status, categories=STATUS_CATEGORIES)
+merged_df["late_minutes"] = np.where(late, np.round(delta_min), np.where(on_time | early, 0.0, np.nan))
 
 # --- Summary Report ---
-summary = merged_df.copy()
-report = summary.groupby(["employee_id", "employee_name", "pc_number"]).agg(
-    count_ontime=("status", lambda x: (x == "On Time").sum()),
-    count_late=("status", lambda x: (x == "Late").sum()),
-    count_early=("status", lambda x: (x == "Early").sum()),
-    count_absent=("status", lambda x: (x == "Absent").sum()),
-    avg_late_minutes=("late_minutes", lambda x: round(x[x > 0].mean(), 2) if (x > 0).any() else 0)
-).reset_index()
-
-store_map = dict(zip(stores_df["pc_number"], stores_df["store_name"]))
+# Read-only from here on, so both tables and the charts below share merged_df without a copy
+summary = merged_df
+report_keys = ["employee_id", "employee_name", "pc_number"]
+
+# One crosstab yields every per-employee status count; both tables below reuse it
+status_counts = pd.crosstab([summary[k] for k in report_keys], summary["status"]).reindex(
+    columns=STATUS_CATEGORIES, fill_value=0
+)
+late_rows = summary[summary["late_minutes"] > 0]
+avg_late_minutes = (
+    late_rows.groupby(report_keys, observed=True)["late_minutes"].mean().round(2)
+    .reindex(status_counts.index).fillna(0)
+)
+
+report = pd.DataFrame({
+    "count_ontime": status_counts["On Time"],
+    "count_late": status_counts["Late"],
+    "count_early": status_counts["Early"],
+    "count_absent": status_counts["Absent"],
+    "avg_late_minutes": avg_late_minutes
+}).reset_index()
+
 report["location"] = report["pc_number"].map(store_map)
 report.drop(columns="pc_number", inplace=True)
 
@@ -129,14 +206,14 @@ report.drop(columns="pc_number", inplace=True)
 st.subheader("📋 Employee Punctuality Summary")
 
 # Calculate punctuality metrics
-detailed_report = summary.groupby(["employee_id", "employee_name", "pc_number"]).agg(
-    days_scheduled=("status", "count"),
-    times_on_time=("status", lambda x: (x == "On Time").sum()),
-    times_late=("status", lambda x: (x == "Late").sum()),
-    times_early=("status", lambda x: (x == "Early").sum()),
-    times_absent=("status", lambda x: (x == "Absent").sum()),
-    avg_late_minutes=("late_minutes", lambda x: round(x[x > 0].mean(), 2) if (x > 0).any() else 0)
-).reset_index()
+detailed_report = pd.DataFrame({
+    "days_scheduled": status_counts.sum(axis=1),
+    "times_on_time": status_counts["On Time"],
+    "times_late": status_counts["Late"],
+    "times_early": status_counts["Early"],
+    "times_absent": status_counts["Absent"],
+    "avg_late_minutes": avg_late_minutes
+}).reset_index()
 
 # Calculate punctuality percentage
 # Punctuality = (On Time + Early) / (On Time + Late + Early) * 100
@@ -144,10 +221,10 @@ detailed_report = summary.groupby(["employee_id", "employee_name", "pc_number"])
 detailed_report["attendance_days"] = (detailed_report["times_on_time"] + 
                                     detailed_report["times_late"] + 
                                     detailed_report["times_early"])
-detailed_report["punctuality_percentage"] = detailed_report.apply(
-    lambda row: round((row["times_on_time"] + row["times_early"]) / row["attendance_days"] * 100, 1) 
-    if row["attendance_days"] > 0 else 0, axis=1
-)
+punctual_days = (detailed_report["times_on_time"] + detailed_report["times_early"]).to_numpy(dtype=float)
+attendance_days = detailed_report["attendance_days"].to_numpy(dtype=float)
+punctuality = np.divide(punctual_days, attendance_days, out=np.zeros_like(punctual_days), where=attendance_days > 0)
+detailed_report["punctuality_percentage"] = np.round(punctuality * 100, 1)
 
 # Add location mapping
 detailed_report["location"] = detailed_report["pc_number"].map(store_map)
@@ -168,31 +245,26 @@ display_report = detailed_report[[
     "avg_late_minutes": "Avg Late (mins)"
 })
 
-# Function to get color based on punctuality percentage
-def get_punctuality_color(percentage):
-    if percentage >= 95:
-        return "background-color: #28a745; color: white"  # Dark Green
-    elif percentage >= 90:
-        return "background-color: #5cb85c; color: white"  # Medium Green
-    elif percentage >= 85:
-        return "background-color: #f0ad4e; color: white"  # Yellow-Orange
-    elif percentage >= 80:
-        return "background-color: #fd7e14; color: white"  # Bright Orange
-    elif percentage >= 75:
-        return "background-color: #e67e22; color: white"  # Deep Orange
-    elif percentage >= 70:
-        return "background-color: #d35400; color: white"  # Dark Orange
-    else:
-        return "background-color: #dc3545; color: white"  # Bold Red
+# Punctuality color bands: [lower bound, next bound) -> cell style, worst band first
+PUNCTUALITY_BINS = [-np.inf, 70, 75, 80, 85, 90, 95, np.inf]
+PUNCTUALITY_STYLES = np.array([
+    "background-color: #dc3545; color: white",  # Bold Red
+    "background-color: #d35400; color: white",  # Dark Orange
+    "background-color: #e67e22; color: white",  # Deep Orange
+    "background-color: #fd7e14; color: white",  # Bright Orange
+    "background-color: #f0ad4e; color: white",  # Yellow-Orange
+    "background-color: #5cb85c; color: white",  # Medium Green
+    "background-color: #28a745; color: white",  # Dark Green
+])
 
 # Apply styling to the dataframe
 def style_punctuality_table(df):
-    def apply_color(row):
-        percentage = row["Punctuality %"]
-        color = get_punctuality_color(percentage)
-        return [color if col == "Employee Name" else "" for col in row.index]
-    
-    return df.style.apply(apply_color, axis=1).format({
+    # One pd.cut bins every percentage at once; missing values fall into the red band
+    band = pd.cut(df["Punctuality %"], PUNCTUALITY_BINS, labels=False, right=False).fillna(0).astype(int)
+    styles = pd.DataFrame("", index=df.index, columns=df.columns)
+    styles["Employee Name"] = PUNCTUALITY_STYLES[band.to_numpy()]
+
+    return df.style.apply(lambda _: styles, axis=None).format({
         "Punctuality %": "{:.1f}%",
         "Avg Late (mins)": "{:.1f}"
     })
@@ -237,9 +309,12 @@ st.dataframe(report)
 
 # --- On Time vs Late per Employee ---
 st.subheader("📊 On Time vs Late per Employee")
-plot_data = report[["employee_name", "count_ontime", "count_late"]].copy()
-plot_data = pd.melt(plot_data, id_vars="employee_name", var_name="Status", value_name="Count")
-plot_data["Status"] = plot_data["Status"].str.replace("count_", "").str.title()
+# Slices below feed plotly/melt read-only, so no defensive copies
+plot_data = pd.melt(
+    report, id_vars="employee_name", value_vars=["count_ontime", "count_late"],
+    var_name="Status", value_name="Count"
+)
+plot_data["Status"] = plot_data["Status"].str.removeprefix("count_").str.title()
 
 fig_bar = px.bar(plot_data, x="employee_name", y="Count", color="Status", barmode="group",
                  title="On Time vs Late Clock-ins per Employee")
@@ -248,8 +323,8 @@ st.plotly_chart(fig_bar, use_container_width=True)
 
 # --- Daily Trend ---
 st.subheader("📆 Daily Punctuality Trend")
-trend_data = summary[summary["status"].isin(["On Time", "Late"])].copy()
-trend_grouped = trend_data.groupby(["date", "status"]).size().reset_index(name="count")
+trend_data = summary[summary["status"].isin(["On Time", "Late"])]
+trend_grouped = trend_data.groupby(["date", "status"], observed=True).size().reset_index(name="count")
 
 fig_trend = px.line(trend_grouped, x="date", y="count", color="status", markers=True,
                     title="Daily Punctuality Trend")
@@ -259,39 +334,47 @@ st.plotly_chart(fig_trend, use_container_width=True)
 st.subheader("🔍 Search Employee Clock-in Records")
 search_name = st.text_input("Search by Employee Name (partial or full):").strip().lower()
 
-sched_df_dedup = sched_df.sort_values(by=["employee_id", "date", "start_time"]).drop_duplicates(
-    subset=["employee_id", "date"], keep="first")
+# Only name matching and slicing touch every clock-in; the schedule lookup, merge and date
+# formatting run on the visible page alone.
+search_df = clock_df
+# Single-character searches match nearly everyone, so filtering starts at two characters
+if len(search_name) >= 2:
+    search_df = search_df[search_df["_name_lower"].str.contains(search_name, regex=False, na=False)]
+
+page_size = 20
+total_rows = len(search_df)
+total_pages = (total_rows - 1) // page_size + 1
+page_num = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1)
+start_idx = (page_num - 1) * page_size
+end_idx = start_idx + page_size
+page_clock = search_df.iloc[start_idx:end_idx]
 
-search_df = pd.merge(
-    clock_df,
+page_sched = sched_df[
+    sched_df["employee_id"].isin(page_clock["employee_id"]) & sched_df["date"].isin(page_clock["date"])
+]
+# Only a lookup side for the left merge below, so group order does not matter
+sched_df_dedup = earliest_per_day(page_sched, "start_time", sort=False)
+
+page_df = pd.merge(
+    page_clock[["employee_id", "employee_name", "date", "time_in", "time_out", "pc_number"]],
     sched_df_dedup[["employee_id", "date", "start_time", "end_time"]],
-    on=["employee_id", "date"], how="left"
+    on=["employee_id", "date"], how="left", validate="one_to_one"
 )
-search_df["date"] = search_df["date"].dt.strftime("%Y-%m-%d")
-search_df = search_df[[
+page_df = page_df[[
     "employee_id", "employee_name", "date", "start_time", "end_time", "time_in", "time_out", "pc_number"
 ]].rename(columns={
     "pc_number": "location",
     "time_in": "clock_in",
     "time_out": "clock_out"
 })
-
-if search_name:
-    search_df = search_df[search_df["employee_name"].str.lower().str.contains(search_name)]
-
-page_size = 20
-total_rows = len(search_df)
-total_pages = (total_rows - 1) // page_size + 1
-page_num = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1)
-start_idx = (page_num - 1) * page_size
-end_idx = start_idx + page_size
-st.dataframe(search_df.iloc[start_idx:end_idx], use_container_width=True)
+page_df["date"] = page_df["date"].dt.strftime("%Y-%m-%d")
+st.dataframe(page_df, use_container_width=True)
 st.caption(f"Showing {start_idx+1}-{min(end_idx, total_rows)} of {total_rows} records")
 
 # --- Store-wise Summary ---
 st.subheader("🏪 Store-wise Punctuality Breakdown")
-store_summary = summary[summary["status"].isin(["On Time", "Late"])].copy()
-store_counts = store_summary.groupby(["pc_number", "status"]).size().reset_index(name="Count")
+store_summary = summary[summary["status"].isin(["On Time", "Late"])]
+store_counts = store_summary.groupby(["pc_number", "status"], observed=True).size().reset_index(name="Count")
 store_counts["store_name"] = store_counts["pc_number"].map(store_map)
 store_counts["Status"] = store_counts["status"]
 
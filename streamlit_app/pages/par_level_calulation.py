@@ -40,13 +40,20 @@ safety_percent = st.sidebar.slider(
 # ---------------------------
 # Compute results
 # ---------------------------
-with st.spinner("Calculating cycle-based par levels..."):
-    par_df, ctx_df = par_engine.get_par_for_next_order(
+# Cached per slider combination; keyed on today's date too, since the order context
+# and history cutoff both move with the calendar.
+@st.cache_data(ttl=600)
+def cached_par_for_next_order(window_days, safety_percent, today):
+    return par_engine.get_par_for_next_order(
         pc_number=None,
+        today=today,
         window_days=window_days,
         safety_percent=safety_percent
     )
 
+with st.spinner("Calculating cycle-based par levels..."):
+    par_df, ctx_df = cached_par_for_next_order(window_days, safety_percent, pd.Timestamp.now().date())
+
 if par_df.empty:
     st.warning("No data available for par level calculation. Please ensure ndcp_invoices table has data.")
     st.stop()
@@ -54,7 +61,8 @@ if par_df.empty:
 # ---------------------------
 # Store filter
 # ---------------------------
-stores_list = ['All Stores'] + sorted(par_df['pc_number'].unique().tolist())
+# ctx_df already holds one row per store, sorted, so it doubles as the option list
+stores_list = ['All Stores'] + ctx_df['pc_number'].tolist()
 selected_store = st.sidebar.selectbox("Filter by Store (PC Number)", stores_list)
 
 if selected_store != "All Stores":
@@ -156,9 +164,14 @@ with colC:
 # ---------------------------
 # Download
 # ---------------------------
+# Serialized once per distinct table instead of on every rerun
+@st.cache_data(ttl=600)
+def to_csv_bytes(df):
+    return df.to_csv(index=False).encode("utf-8")
+
 st.download_button(
     label="📥 Download Cycle Par (CSV)",
-    data=par_df.to_csv(index=False),
+    data=to_csv_bytes(par_df),
     file_name=f"cycle_par_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
     mime="text/csv"
 )
@@ -8,12 +8,18 @@ import os
 db_url = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
 
 try:
-    engine = create_engine(db_url)
+    # One small pooled engine at module scope; pre-ping drops dead connections, recycle avoids idle timeouts.
+    # Built inside the try so a bad URL or missing driver is reported like any other failure.
+    engine = create_engine(
+        db_url,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
     with engine.connect() as conn:
-        result = conn.execute(text("SELECT NOW();"))  # <-- Wrap with text()
+        conn.execute(text("SELECT 1"))  # <-- Wrap with text()
         print("✅ Connected successfully!")
-        for row in result:
-            print("🕒 DB Time:", row[0])
 except Exception as e:
     print("❌ Connection failed.")
     print("📄 Error:", e)
@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client
+from postgrest.exceptions import APIError
+from dashboard import supabase_fetch
 
 st.set_page_config(page_title="Par Delta Dashboard", layout="wide")
 st.title("📊 Par Delta Operational Dashboard")
@@ -24,74 +28,94 @@ Live data is loaded from Supabase.
 """)
 
 # --- Supabase Setup ---
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Cached so the client and its HTTP connection pool survive reruns
+@st.cache_resource
+def get_supabase():
+    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+
+supabase = get_supabase()
+
+# --- Calculate rolling 7-day window (Sunday to Saturday) ---
+@st.cache_data(ttl=300)
+def get_week_window():
+    # Computed once and shared, so every loader below is keyed on the same (start, end) bounds
+    today = datetime.now().date()
+    # Find the most recent Saturday (weekday 5 = Saturday)
+    days_since_saturday = (today.weekday() + 2) % 7  # Convert to days since Saturday
+    last_saturday = today - timedelta(days=days_since_saturday)
+    return last_saturday - timedelta(days=6), last_saturday  # 7 days total including Saturday
+
+seven_days_ago, last_saturday = get_week_window()
 
 # --- Load Data for Home Page Overview ---
+# Fallback loaders, used only when the donut_overview_7d function (supabase/migrations) isn't
+# deployed: this week's donut rows, filtered and projected in Postgres.
+def fetch_donut_rows(table, columns, start, end):
+    def query(count=None):
+        return (
+            supabase.table(table).select(",".join(columns), count=count)
+            .ilike("product_type", "%donut%")
+            .gte("date", start)
+            .lte("date", end)
+        )
+    return supabase_fetch.fetch_rows(query, columns)
+
 @st.cache_data(ttl=3600)
-def load_all_rows(table):
-    all_data = []
-    chunk_size = 1000
-    offset = 0
-    while True:
-        try:
-            response = supabase.table(table).select("*").range(offset, offset + chunk_size - 1).execute()
-        except Exception as e:
-            st.error(f"Error loading table '{table}': {e}")
-            break
-        data_chunk = response.data
-        if not data_chunk:
-            break
-        all_data.extend(data_chunk)
-        offset += chunk_size
-    return pd.DataFrame(all_data)
-
-sales_df = load_all_rows("donut_sales_hourly")
-usage_df = load_all_rows("usage_overview")
-
-# --- Preprocessing ---
-sales_df["date"] = pd.to_datetime(sales_df["date"], errors="coerce").dt.date
-sales_df["pc_number"] = sales_df["pc_number"].astype(str).str.strip().str.zfill(6)
-sales_df["product_type"] = sales_df["product_type"].astype(str).str.lower()
-
-usage_df["date"] = pd.to_datetime(usage_df["date"], errors="coerce").dt.date
-usage_df["pc_number"] = usage_df["pc_number"].astype(str).str.strip().str.zfill(6)
-usage_df["product_type"] = usage_df["product_type"].astype(str).str.lower()
+def load_donut_rows(table, columns, start, end):
+    # Normalized once behind the cache instead of on every rerun
+    df = fetch_donut_rows(table, columns, start, end)
+    # Kept as datetime64 (midnight) so the merge compares int64, not date objects
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601", errors="coerce").dt.normalize()
+    df["pc_number"] = df["pc_number"].astype(str).str.strip().str.zfill(6).astype("category")
+    return df
 
-# --- Calculate rolling 7-day window (Sunday to Saturday) ---
-today = datetime.now().date()
-# Find the most recent Saturday (weekday 5 = Saturday)
-days_since_saturday = (today.weekday() + 2) % 7  # Convert to days since Saturday
-last_saturday = today - timedelta(days=days_since_saturday)
-seven_days_ago = last_saturday - timedelta(days=6)  # 7 days total including Saturday
-
-# --- Filter for last 7 days and only donuts ---
-donut_sales = sales_df[
-    (sales_df["product_type"].str.contains("donut", na=False)) &
-    (sales_df["date"] >= seven_days_ago) & (sales_df["date"] <= last_saturday)
-]
-usage_donuts = usage_df[
-    (usage_df["product_type"].str.contains("donut", na=False)) &
-    (usage_df["date"] >= seven_days_ago) & (usage_df["date"] <= last_saturday)
-]
-
-# --- Aggregate sales by date and pc_number ---
-sales_summary = donut_sales.groupby(["date", "pc_number"]).agg(SalesQty=("quantity", "sum")).reset_index()
-
-# --- Merge and calculate ---
-merged = pd.merge(usage_donuts, sales_summary, on=["date", "pc_number"], how="left")
-merged["SalesQty"] = merged["SalesQty"].fillna(0)
-merged["CalculatedWaste"] = merged["ordered_qty"] - merged["SalesQty"]
-merged["Gap"] = merged["CalculatedWaste"] - merged["wasted_qty"]
-
-# --- Rolling 7-day averages per pc_number ---
-donut_overview = merged.groupby("pc_number").agg(
-    Calculated_Waste_7d_Avg=("CalculatedWaste", "mean"),
-    Recorded_Waste_7d_Avg=("wasted_qty", "mean"),
-    Gap=("Gap", "mean")
-).reset_index()
-donut_overview.rename(columns={"pc_number": "PC Number"}, inplace=True)
+DONUT_OVERVIEW_COLUMNS = ["pc_number", "calculated_waste_7d_avg", "recorded_waste_7d_avg", "gap"]
+
+@st.cache_data(ttl=3600)
+def load_donut_overview(start, end):
+    # Per-store averages computed in Postgres (supabase/migrations); None when the function
+    # isn't deployed, so the page falls back to aggregating the raw tables here. Any other error
+    # propagates, so a transient failure isn't cached as "not deployed" for the next hour.
+    try:
+        response = supabase.rpc("donut_overview_7d", {"from_date": start, "to_date": end}).execute()
+    except APIError as e:
+        if e.code == "PGRST202":  # PostgREST: function not found
+            return None
+        raise
+    df = pd.DataFrame(response.data, columns=DONUT_OVERVIEW_COLUMNS)
+    for col in DONUT_OVERVIEW_COLUMNS[1:]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df.rename(columns={
+        "pc_number": "PC Number",
+        "calculated_waste_7d_avg": "Calculated_Waste_7d_Avg",
+        "recorded_waste_7d_avg": "Recorded_Waste_7d_Avg",
+        "gap": "Gap"
+    })
+
+donut_overview = load_donut_overview(seven_days_ago.isoformat(), last_saturday.isoformat())
+
+if donut_overview is None:
+    # Fallback: load this week's raw donut rows and aggregate them here
+    start, end = seven_days_ago.isoformat(), last_saturday.isoformat()
+    donut_sales = load_donut_rows("donut_sales_hourly", ["date", "pc_number", "quantity"], start, end)
+    usage_donuts = load_donut_rows("usage_overview", ["date", "pc_number", "ordered_qty", "wasted_qty"], start, end)
+
+    # --- Aggregate sales by date and pc_number ---
+    sales_summary = donut_sales.groupby(["date", "pc_number"], observed=True).agg(SalesQty=("quantity", "sum")).reset_index()
+
+    # --- Merge and calculate ---
+    merged = pd.merge(usage_donuts, sales_summary, on=["date", "pc_number"], how="left")
+    merged["SalesQty"] = merged["SalesQty"].fillna(0)
+    merged["CalculatedWaste"] = merged["ordered_qty"] - merged["SalesQty"]
+    merged["Gap"] = merged["CalculatedWaste"] - merged["wasted_qty"]
+
+    # --- Rolling 7-day averages per pc_number ---
+    donut_overview = merged.groupby("pc_number", observed=True).agg(
+        Calculated_Waste_7d_Avg=("CalculatedWaste", "mean"),
+        Recorded_Waste_7d_Avg=("wasted_qty", "mean"),
+        Gap=("Gap", "mean")
+    ).reset_index()
+    donut_overview.rename(columns={"pc_number": "PC Number"}, inplace=True)
 
 st.subheader(
     f"🍩 Donut Overview (Last 7 Days: {seven_days_ago.strftime('%Y-%m-%d')} to {last_saturday.strftime('%Y-%m-%d')})"
@@ -99,45 +123,76 @@ st.subheader(
 st.dataframe(donut_overview[["PC Number", "Calculated_Waste_7d_Avg", "Recorded_Waste_7d_Avg", "Gap"]])
 
 # --- Labor Overview Table ---
-# Schedule
-sched_resp = supabase.table("schedule_table_labor") \
-    .select("pc_number, scheduled_hours, date") \
-    .gte("date", seven_days_ago.isoformat()) \
-    .lte("date", last_saturday.isoformat()) \
-    .execute()
-sched_df = pd.DataFrame(sched_resp.data)
-
-# Ideal
-ideal_resp = supabase.table("ideal_table_labor") \
-    .select("pc_number, ideal_hours, date") \
-    .gte("date", seven_days_ago.isoformat()) \
-    .lte("date", last_saturday.isoformat()) \
-    .execute()
-ideal_df = pd.DataFrame(ideal_resp.data)
-
-# Actual
-actual_resp = supabase.table("actual_table_labor") \
-    .select("pc_number, actual_hours, date") \
-    .gte("date", seven_days_ago.isoformat()) \
-    .lte("date", last_saturday.isoformat()) \
-    .execute()
-actual_df = pd.DataFrame(actual_resp.data)
-
-# Merge and calculate variances
-if not sched_df.empty and not ideal_df.empty and not actual_df.empty:
-    sched_sum = sched_df.groupby("pc_number")["scheduled_hours"].sum().reset_index()
-    ideal_sum = ideal_df.groupby("pc_number")["ideal_hours"].sum().reset_index()
-    actual_sum = actual_df.groupby("pc_number")["actual_hours"].sum().reset_index()
-
-    labor = sched_sum.merge(ideal_sum, on="pc_number", how="outer").merge(actual_sum, on="pc_number", how="outer").fillna(0)
-    labor["Schedule_vs_Ideal_Var_%"] = ((labor["scheduled_hours"] - labor["ideal_hours"]) / labor["ideal_hours"].replace(0, 1)) * 100
-    labor["Schedule_vs_Actual_Var_%"] = ((labor["scheduled_hours"] - labor["actual_hours"]) / labor["actual_hours"].replace(0, 1)) * 100
-    labor.rename(columns={"pc_number": "PC Number"}, inplace=True)
+LABOR_TOTAL_COLUMNS = ["pc_number", "scheduled_hours", "ideal_hours", "actual_hours"]
+
+def fetch_labor_totals(start, end):
+    # Per-store sums of all three labor tables in one Postgres call (supabase/migrations);
+    # None when the function isn't deployed, so the page falls back to three table queries.
+    try:
+        response = supabase.rpc("labor_overview_totals", {"from_date": start, "to_date": end}).execute()
+    except APIError as e:
+        if e.code == "PGRST202":  # PostgREST: function not found
+            return None
+        raise
+    df = pd.DataFrame(response.data, columns=LABOR_TOTAL_COLUMNS)
+    for col in LABOR_TOTAL_COLUMNS[1:]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+def fetch_labor(table, hours_col, start, end):
+    response = supabase.table(table) \
+        .select(f"pc_number, {hours_col}, date") \
+        .gte("date", start) \
+        .lte("date", end) \
+        .execute()
+    return pd.DataFrame(response.data)
+
+@st.cache_data(ttl=3600)
+def load_labor_overview(start, end):
+    # The finished per-store table is cached, so reruns skip both the queries and the variance math
+    labor = fetch_labor_totals(start, end)
+
+    if labor is None:
+        # Schedule, ideal and actual are independent queries, so they run concurrently
+        labor_sources = [
+            ("schedule_table_labor", "scheduled_hours"),
+            ("ideal_table_labor", "ideal_hours"),
+            ("actual_table_labor", "actual_hours"),
+        ]
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            frames = list(pool.map(lambda source: fetch_labor(*source, start, end), labor_sources))
+
+        labor = pd.DataFrame(columns=LABOR_TOTAL_COLUMNS)
+        if all(not df.empty for df in frames):
+            # One long frame tagged with each table's hours column, summed in a single groupby
+            # and unstacked back to a column per table
+            all_labor = pd.concat(
+                [df.rename(columns={hours_col: "hours"}).assign(kind=hours_col)
+                 for df, (_, hours_col) in zip(frames, labor_sources)],
+                ignore_index=True
+            )
+            labor = (
+                all_labor.groupby(["pc_number", "kind"])["hours"].sum()
+                .unstack("kind", fill_value=0)[LABOR_TOTAL_COLUMNS[1:]]
+                .rename_axis(columns=None)
+                .reset_index()
+            )
+
+    # Calculate variances
+    if not labor.empty:
+        # Single vectorized divide; stores with zero ideal/actual hours show 0% instead of a raw hour difference
+        scheduled = labor["scheduled_hours"].to_numpy(dtype=float)
+        for hours_col, var_col in [("ideal_hours", "Schedule_vs_Ideal_Var_%"), ("actual_hours", "Schedule_vs_Actual_Var_%")]:
+            den = labor[hours_col].to_numpy(dtype=float)
+            labor[var_col] = np.divide(scheduled - den, den, out=np.zeros_like(den), where=den != 0) * 100
+    return labor.rename(columns={"pc_number": "PC Number"})
+
+labor = load_labor_overview(seven_days_ago.isoformat(), last_saturday.isoformat())
+
+if not labor.empty:
     st.subheader(
         f"⏱️ Labor Overview (Last 7 Days: {seven_days_ago.strftime('%Y-%m-%d')} to {last_saturday.strftime('%Y-%m-%d')})"
     )
     st.dataframe(labor[["PC Number", "Schedule_vs_Ideal_Var_%", "Schedule_vs_Actual_Var_%"]])
 else:
     st.info("No labor data available for the last 7 days.")
-
-
@@ -0,0 +1,46 @@
+-- Per-store donut waste averages for the home page overview.
+-- Mirrors the page's pandas pipeline: donut sales summed per day/store, joined onto
+-- donut usage rows, then calculated waste, recorded waste and gap averaged per store.
+create or replace function public.donut_overview_7d(
+    from_date date,
+    to_date date
+)
+returns table (
+    pc_number text,
+    calculated_waste_7d_avg numeric,
+    recorded_waste_7d_avg numeric,
+    gap numeric
+)
+language sql
+stable
+as $$
+    with daily_sales as (
+        select
+            s.date,
+            lpad(trim(s.pc_number::text), 6, '0') as pc_number,
+            sum(s.quantity) as sales_qty
+        from donut_sales_hourly s
+        where s.date between from_date and to_date
+          and s.product_type ilike '%donut%'
+        group by 1, 2
+    ),
+    usage_waste as (
+        select
+            lpad(trim(u.pc_number::text), 6, '0') as pc_number,
+            u.ordered_qty - coalesce(ds.sales_qty, 0) as calculated_waste,
+            u.wasted_qty
+        from usage_overview u
+        left join daily_sales ds
+          on ds.date = u.date and ds.pc_number = lpad(trim(u.pc_number::text), 6, '0')
+        where u.date between from_date and to_date
+          and u.product_type ilike '%donut%'
+    )
+    select
+        pc_number,
+        avg(calculated_waste) as calculated_waste_7d_avg,
+        avg(wasted_qty) as recorded_waste_7d_avg,
+        avg(calculated_waste - wasted_qty) as gap
+    from usage_waste
+    group by pc_number
+    order by pc_number;
+$$;
@@ -0,0 +1,41 @@
+-- Per-store scheduled, ideal and actual hours for the home page labor overview.
+-- One UNION ALL over the three labor tables instead of three round trips and a
+-- client-side merge. Returns no rows unless all three tables have data in the
+-- window, matching the page's "no labor data" check.
+create or replace function public.labor_overview_totals(
+    from_date date,
+    to_date date
+)
+returns table (
+    pc_number text,
+    scheduled_hours numeric,
+    ideal_hours numeric,
+    actual_hours numeric
+)
+language sql
+stable
+as $$
+    with labor as (
+        select pc_number::text as pc_number, 'sched' as kind, scheduled_hours as hours
+        from schedule_table_labor
+        where date between from_date and to_date
+        union all
+        select pc_number::text, 'ideal', ideal_hours
+        from ideal_table_labor
+        where date between from_date and to_date
+        union all
+        select pc_number::text, 'actual', actual_hours
+        from actual_table_labor
+        where date between from_date and to_date
+    )
+    select
+        pc_number,
+        coalesce(sum(hours) filter (where kind = 'sched'), 0) as scheduled_hours,
+        coalesce(sum(hours) filter (where kind = 'ideal'), 0) as ideal_hours,
+        coalesce(sum(hours) filter (where kind = 'actual'), 0) as actual_hours
+    from labor
+    where pc_number is not null
+      and (select count(distinct kind) from labor) = 3
+    group by pc_number
+    order by pc_number;
+$$;
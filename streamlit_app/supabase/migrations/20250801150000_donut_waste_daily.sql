@@ -0,0 +1,75 @@
+-- Daily per-store donut waste, materialized so the home page overview reads a small
+-- pre-joined table instead of joining hourly sales onto usage on every call.
+-- Each row keeps sums and non-null counts, so averages over usage rows stay exact.
+create materialized view if not exists public.v_donut_waste_daily as
+    with daily_sales as (
+        select
+            s.date,
+            lpad(trim(s.pc_number::text), 6, '0') as pc_number,
+            sum(s.quantity) as sales_qty
+        from donut_sales_hourly s
+        where s.product_type ilike '%donut%'
+        group by 1, 2
+    ),
+    usage_waste as (
+        select
+            u.date,
+            lpad(trim(u.pc_number::text), 6, '0') as pc_number,
+            u.ordered_qty - coalesce(ds.sales_qty, 0) as calculated_waste,
+            u.wasted_qty
+        from usage_overview u
+        left join daily_sales ds
+          on ds.date = u.date and ds.pc_number = lpad(trim(u.pc_number::text), 6, '0')
+        where u.date is not null
+          and u.product_type ilike '%donut%'
+    )
+    select
+        date,
+        pc_number,
+        sum(calculated_waste) as calculated_waste,
+        count(calculated_waste) as calculated_waste_rows,
+        sum(wasted_qty) as wasted_qty,
+        count(wasted_qty) as wasted_qty_rows,
+        sum(calculated_waste - wasted_qty) as gap,
+        count(calculated_waste - wasted_qty) as gap_rows
+    from usage_waste
+    group by date, pc_number;
+
+-- Required for refresh ... concurrently, which keeps the view readable while it rebuilds
+create unique index if not exists v_donut_waste_daily_key
+    on public.v_donut_waste_daily (date, pc_number);
+
+-- Nightly rebuild as a backstop; the upload script refreshes the view right after each load
+-- through refresh_v_donut_waste_daily()
+create extension if not exists pg_cron;
+
+select cron.schedule(
+    'refresh-v-donut-waste-daily',
+    '0 6 * * *',
+    'refresh materialized view concurrently public.v_donut_waste_daily'
+);
+
+-- The home page RPC now averages the daily rows instead of re-joining the raw tables.
+create or replace function public.donut_overview_7d(
+    from_date date,
+    to_date date
+)
+returns table (
+    pc_number text,
+    calculated_waste_7d_avg numeric,
+    recorded_waste_7d_avg numeric,
+    gap numeric
+)
+language sql
+stable
+as $$
+    select
+        d.pc_number,
+        sum(d.calculated_waste) / nullif(sum(d.calculated_waste_rows), 0) as calculated_waste_7d_avg,
+        sum(d.wasted_qty) / nullif(sum(d.wasted_qty_rows), 0) as recorded_waste_7d_avg,
+        sum(d.gap) / nullif(sum(d.gap_rows), 0) as gap
+    from public.v_donut_waste_daily d
+    where d.date between from_date and to_date
+    group by d.pc_number
+    order by d.pc_number;
+$$;
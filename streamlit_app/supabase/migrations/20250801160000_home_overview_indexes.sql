@@ -0,0 +1,12 @@
+-- Indexes for the home page overview queries.
+-- The labor overview filters each labor table to the Sunday-Saturday window.
+-- (The donut overview reads v_donut_waste_daily, whose unique (date, pc_number) index
+-- already serves its date range filter.)
+create index if not exists idx_schedule_table_labor_date
+    on public.schedule_table_labor (date);
+
+create index if not exists idx_ideal_table_labor_date
+    on public.ideal_table_labor (date);
+
+create index if not exists idx_actual_table_labor_date
+    on public.actual_table_labor (date);
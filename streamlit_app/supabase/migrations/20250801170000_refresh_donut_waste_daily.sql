@@ -0,0 +1,14 @@
+-- Lets the upload script rebuild v_donut_waste_daily as soon as new usage or sales rows land,
+-- so the home page overview matches the Donut Waste & Gap page without waiting for the
+-- nightly cron job (which stays as a backstop for loads that skip the script).
+-- Security definer: the caller's key does not own the view, the migration role does.
+create or replace function public.refresh_v_donut_waste_daily()
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    refresh materialized view concurrently public.v_donut_waste_daily;
+end;
+$$;